@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Archive and full-text index of issued contracts (Ugovor / Anex)
+
+Each issued PDF is split into its stream objects and a small skeleton.
+Large streams (embedded fonts, logos, shared terms) are stored once,
+content-addressed by SHA-256 and zlib-compressed, so identical resources
+across thousands of contracts take the space of one. The skeleton keeps
+the remaining bytes plus the positions of the resources, which lets
+get_pdf() rebuild the original file byte for byte (checked against the
+stored hash). The structured contract payload is kept next to it and
+indexed with SQLite FTS5 for passenger / contract number / destination
+lookups; departure id and check-in date are plain columns matched exactly.
+"""
+
+from datetime import datetime, timezone
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import zlib
+
+# Streams smaller than this stay inline in the skeleton
+MIN_SHARED_STREAM = 1024
+
+DOCUMENT_TYPES = ('ugovor', 'anex')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+  hash TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  data BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS documents (
+  id INTEGER PRIMARY KEY,
+  document_type TEXT NOT NULL,
+  contract_id TEXT NOT NULL,
+  contract_number TEXT NOT NULL,
+  amendment_number INTEGER NOT NULL DEFAULT 0,  -- 0 for the Ugovor itself
+  departure_id TEXT,
+  check_in_date TEXT,
+  issued_at TEXT NOT NULL,
+  pdf_hash TEXT NOT NULL,
+  pdf_size INTEGER NOT NULL,
+  payload BLOB NOT NULL,
+  skeleton BLOB NOT NULL,
+  UNIQUE (contract_id, document_type, amendment_number)
+);
+
+CREATE TABLE IF NOT EXISTS document_resources (
+  document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+  position INTEGER NOT NULL,
+  skeleton_offset INTEGER NOT NULL,
+  hash TEXT NOT NULL REFERENCES resources(hash),
+  PRIMARY KEY (document_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS idx_document_resources_hash ON document_resources(hash);
+CREATE INDEX IF NOT EXISTS idx_documents_contract ON documents(contract_id);
+CREATE INDEX IF NOT EXISTS idx_documents_departure ON documents(departure_id);
+CREATE INDEX IF NOT EXISTS idx_documents_check_in ON documents(check_in_date);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+  contract_number,
+  passengers,
+  destination,
+  departure,
+  content='',
+  tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+STREAM_START = re.compile(rb'(?<!end)stream\r?\n')
+DIRECT_LENGTH = re.compile(rb'/Length\s+(\d+)\b(?!\s+\d+\s+R)')
+DICT_DELIMITER = re.compile(rb'<<|>>')
+
+# unicode61 remove_diacritics does not decompose Đ/đ, so fold it before FTS
+FOLD_D = str.maketrans({'Đ': 'D', 'đ': 'd'})
+
+
+class ArchiveError(Exception):
+    """Raised when a document can not be archived or rebuilt exactly"""
+
+
+def stream_dict_start(pdf_bytes, lo, hi):
+    """Offset of the outer << of the stream dictionary ending before hi"""
+    delimiters = [(m.start(), m.group()) for m in DICT_DELIMITER.finditer(pdf_bytes, lo, hi)]
+    depth = 0
+    for offset, delimiter in reversed(delimiters):
+        depth += 1 if delimiter == b'>>' else -1
+        if depth == 0:
+            return offset
+    return -1
+
+
+def split_pdf(pdf_bytes):
+    """Split a PDF into (skeleton, [(offset, stream_bytes)]) for large streams"""
+    skeleton = bytearray()
+    streams = []
+    pos = 0
+    scanned = 0
+
+    for match in STREAM_START.finditer(pdf_bytes):
+        start = match.end()
+        if match.start() < scanned:
+            continue
+
+        # Prefer a direct /Length in the stream dictionary, fall back to endstream
+        end = -1
+        dict_start = stream_dict_start(pdf_bytes, scanned, match.start())
+        if dict_start != -1:
+            length_match = DIRECT_LENGTH.search(pdf_bytes, dict_start, match.start())
+            if length_match:
+                end = start + int(length_match.group(1))
+                if not pdf_bytes[end:end + 20].lstrip(b'\r\n').startswith(b'endstream'):
+                    end = -1
+        if end == -1:
+            end = pdf_bytes.find(b'endstream', start)
+            if end == -1:
+                break
+        scanned = end
+
+        if end - start >= MIN_SHARED_STREAM:
+            skeleton += pdf_bytes[pos:start]
+            streams.append((len(skeleton), pdf_bytes[start:end]))
+            pos = end
+
+    skeleton += pdf_bytes[pos:]
+    return bytes(skeleton), streams
+
+
+def join_pdf(skeleton, streams):
+    """Inverse of split_pdf"""
+    parts = []
+    pos = 0
+    for offset, data in streams:
+        parts.append(skeleton[pos:offset])
+        parts.append(data)
+        pos = offset
+    parts.append(skeleton[pos:])
+    return b''.join(parts)
+
+
+def fold_text(text, with_dj=False):
+    """Fold Đ/đ to D/d; with_dj also appends the Dj/dj spelling of such words"""
+    folded = text.translate(FOLD_D)
+    if not with_dj:
+        return folded
+    variants = [
+        word.replace('Đ', 'Dj').replace('đ', 'dj')
+        for word in text.split() if 'Đ' in word or 'đ' in word
+    ]
+    return ' '.join([folded, *variants])
+
+
+def index_fields(payload):
+    """Extract the searchable text from a contract payload"""
+    passengers = fold_text(' '.join(
+        f"{p.get('first_name', '')} {p.get('last_name', '')}".strip()
+        for p in payload.get('passengers', [])
+    ), with_dj=True)
+    destination = ' '.join(filter(None, [
+        payload.get('hotel_name'),
+        payload.get('destination_city'),
+        payload.get('destination_country'),
+    ]))
+    departure = ' '.join(filter(None, [
+        payload.get('check_in_date'),
+        payload.get('check_out_date'),
+        payload.get('departure_point'),
+        payload.get('departure_id'),
+    ]))
+    return payload['contract_number'], passengers, fold_text(destination, with_dj=True), fold_text(departure)
+
+
+def fts_query(text):
+    """Turn free user input into an FTS5 prefix query (all terms must match)"""
+    terms = re.findall(r'\w+', fold_text(text or ''), flags=re.UNICODE)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+class ContractArchive:
+    """SQLite-backed store for issued contract documents"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def store(self, payload, pdf_bytes, document_type='ugovor', amendment_number=0):
+        """Archive one issued document, returning its id"""
+        if document_type not in DOCUMENT_TYPES:
+            raise ValueError(f"Unknown document_type: {document_type}")
+
+        pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        skeleton, streams = split_pdf(pdf_bytes)
+        issued_at = payload.get('issued_at') or datetime.now(timezone.utc).isoformat()
+
+        with self.db:
+            # Take the write lock before the lookup so concurrent stores of the
+            # same document see each other's row
+            self.db.execute('BEGIN IMMEDIATE')
+            existing = self.db.execute(
+                """SELECT id, pdf_hash FROM documents
+                   WHERE contract_id = ? AND document_type = ? AND amendment_number = ?""",
+                (payload['contract_id'], document_type, amendment_number),
+            ).fetchone()
+            if existing is not None:
+                # Retries of the same document are idempotent; a different PDF is not
+                if existing['pdf_hash'] == pdf_hash:
+                    return existing['id']
+                raise ArchiveError(
+                    f"A different {document_type} {amendment_number} is already archived "
+                    f"for contract {payload['contract_id']} (document {existing['id']})"
+                )
+
+            cursor = self.db.execute(
+                """INSERT INTO documents (document_type, contract_id, contract_number,
+                   amendment_number, departure_id, check_in_date, issued_at, pdf_hash,
+                   pdf_size, payload, skeleton)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    document_type,
+                    payload['contract_id'],
+                    payload['contract_number'],
+                    amendment_number,
+                    payload.get('departure_id'),
+                    payload.get('check_in_date'),
+                    issued_at,
+                    pdf_hash,
+                    len(pdf_bytes),
+                    zlib.compress(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8'), 9),
+                    zlib.compress(skeleton, 9),
+                ),
+            )
+            document_id = cursor.lastrowid
+
+            for position, (offset, data) in enumerate(streams):
+                resource_hash = hashlib.sha256(data).hexdigest()
+                self.db.execute(
+                    'INSERT OR IGNORE INTO resources (hash, size, data) VALUES (?, ?, ?)',
+                    (resource_hash, len(data), zlib.compress(data, 9)),
+                )
+                self.db.execute(
+                    'INSERT INTO document_resources (document_id, position, skeleton_offset, hash) VALUES (?, ?, ?, ?)',
+                    (document_id, position, offset, resource_hash),
+                )
+
+            self.db.execute(
+                'INSERT INTO documents_fts (rowid, contract_number, passengers, destination, departure) VALUES (?, ?, ?, ?, ?)',
+                (document_id, *index_fields(payload)),
+            )
+
+        return document_id
+
+    def get_payload(self, document_id):
+        row = self.db.execute('SELECT payload FROM documents WHERE id = ?', (document_id,)).fetchone()
+        if row is None:
+            raise KeyError(document_id)
+        return json.loads(zlib.decompress(row['payload']))
+
+    def get_pdf(self, document_id):
+        """Rebuild the exact issued PDF"""
+        row = self.db.execute(
+            'SELECT skeleton, pdf_hash FROM documents WHERE id = ?', (document_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(document_id)
+
+        resources = self.db.execute(
+            """SELECT dr.skeleton_offset, r.data FROM document_resources dr
+               JOIN resources r ON r.hash = dr.hash
+               WHERE dr.document_id = ? ORDER BY dr.position""",
+            (document_id,),
+        ).fetchall()
+        pdf_bytes = join_pdf(
+            zlib.decompress(row['skeleton']),
+            [(r['skeleton_offset'], zlib.decompress(r['data'])) for r in resources],
+        )
+
+        if hashlib.sha256(pdf_bytes).hexdigest() != row['pdf_hash']:
+            raise ArchiveError(f"Rebuilt PDF does not match stored hash for document {document_id}")
+        return pdf_bytes
+
+    def search(self, text, limit=20):
+        """Full-text search over passengers, contract numbers and destinations"""
+        query = fts_query(text)
+        if not query:
+            return []
+        return self.db.execute(
+            """SELECT d.id, d.document_type, d.contract_id, d.contract_number,
+                      d.amendment_number, d.issued_at
+               FROM documents_fts f JOIN documents d ON d.id = f.rowid
+               WHERE documents_fts MATCH ?
+               ORDER BY f.rank LIMIT ?""",
+            (query, limit),
+        ).fetchall()
+
+    def find_for_passenger(self, passenger, departure):
+        """The contract for passenger X on departure Y (departure id or check-in date)"""
+        conditions = []
+        params = []
+        passenger_query = fts_query(passenger)
+        if passenger_query:
+            conditions.append('documents_fts MATCH ?')
+            params.append(f"passengers : ({passenger_query})")
+        departure = (departure or '').strip()
+        if departure:
+            # Exact match: a date is not a bag of prefix tokens
+            conditions.append('(d.departure_id = ? OR d.check_in_date = ?)')
+            params.extend([departure, departure])
+        if not conditions:
+            return []
+        return self.db.execute(
+            f"""SELECT d.id, d.document_type, d.contract_id, d.contract_number,
+                      d.amendment_number, d.issued_at
+               FROM documents_fts f JOIN documents d ON d.id = f.rowid
+               WHERE {' AND '.join(conditions)}
+               ORDER BY d.issued_at DESC""",
+            params,
+        ).fetchall()
+
+    def stats(self):
+        """Stored vs original size, to see what deduplication saves"""
+        original = self.db.execute('SELECT COUNT(*), COALESCE(SUM(pdf_size), 0) FROM documents').fetchone()
+        skeletons = self.db.execute(
+            'SELECT COALESCE(SUM(LENGTH(skeleton) + LENGTH(payload)), 0) FROM documents'
+        ).fetchone()[0]
+        resources = self.db.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM resources').fetchone()
+        return {
+            'documents': original[0],
+            'original_bytes': original[1],
+            'shared_resources': resources[0],
+            'stored_bytes': skeletons + resources[1],
+        }
+
+
+if __name__ == '__main__':
+    with ContractArchive(sys.argv[1]) as archive:
+        for row in archive.search(' '.join(sys.argv[2:])):
+            print(f"{row['contract_number']:>12}  {row['document_type']:<6}  {row['issued_at']}  #{row['id']}")
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Incremental payment ledger for contract_payments and daily_reconciliations
+
+Keeps materialized running totals per contract, per agent and per agent-day,
+updated from an append-only stream of payment events. Every contract_payments
+row change (new payment, status change, correction) is appended as a new
+event carrying the full row, so the ledger only has to retract the previous
+contribution of that payment and apply the new one. Reads are dictionary
+lookups; rebuild() replays the whole stream for verification.
+
+Refunds: the negative 'refund' row is the single source of truth. An original
+payment whose status becomes 'refunded' keeps counting as paid, so the money
+is subtracted once, by its refund row.
+
+Ordering: events are applied per payment by seq. A version at or below the
+seq already applied for that payment is stale and ignored; late events for
+other payments are still applied.
+
+Currency: a contract has one currency. Events in another currency are not
+applied but collected in PaymentLedger.rejected, so the rest of the stream
+(and any rebuild of it) still goes through.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+import json
+import sys
+
+ZERO = Decimal('0.00')
+
+# contract_payments.payment_type
+PAYMENT_TYPES = ('deposit', 'balance', 'full', 'refund', 'adjustment')
+
+# contract_payments.status - completed and refunded originals count as paid
+PAYMENT_STATUSES = ('pending', 'completed', 'failed', 'refunded')
+
+
+@dataclass(frozen=True)
+class PaymentEvent:
+    """One version of a contract_payments row, in stream order"""
+    seq: int
+    payment_id: str
+    contract_id: str
+    organization_id: str
+    recorded_by: str
+    payment_date: date
+    payment_type: str
+    amount: Decimal
+    currency: str
+    status: str = 'completed'
+
+    def __post_init__(self):
+        if self.payment_type not in PAYMENT_TYPES:
+            raise ValueError(f"Unknown payment_type: {self.payment_type}")
+        if self.status not in PAYMENT_STATUSES:
+            raise ValueError(f"Unknown payment status: {self.status}")
+
+    @classmethod
+    def from_row(cls, seq, row):
+        """Build an event from a contract_payments row (dict)"""
+        payment_date = row['payment_date']
+        if isinstance(payment_date, str):
+            payment_date = date.fromisoformat(payment_date)
+        return cls(
+            seq=seq,
+            payment_id=row['id'],
+            contract_id=row['contract_id'],
+            organization_id=row['organization_id'],
+            recorded_by=row.get('recorded_by'),
+            payment_date=payment_date,
+            payment_type=row['payment_type'],
+            amount=Decimal(str(row['amount'])),
+            currency=row['currency'],
+            status=row.get('status') or 'completed',
+        )
+
+
+@dataclass
+class Totals:
+    """Running payment totals for one aggregation key"""
+    paid: Decimal = ZERO
+    pending: Decimal = ZERO
+    deposit_paid: Decimal = ZERO
+    balance_paid: Decimal = ZERO
+    refunded: Decimal = ZERO
+    payment_count: int = 0
+    refund_count: int = 0
+
+    def apply(self, event, sign):
+        """Add (sign=1) or retract (sign=-1) one event's contribution"""
+        amount = event.amount * sign
+        if event.status == 'pending':
+            self.pending += amount
+            return
+        if event.status not in ('completed', 'refunded'):
+            return
+        self.paid += amount
+        if event.payment_type == 'deposit':
+            self.deposit_paid += amount
+            self.payment_count += sign
+        elif event.payment_type in ('balance', 'full'):
+            self.balance_paid += amount
+            self.payment_count += sign
+        elif event.payment_type == 'refund':
+            self.refunded -= amount
+            self.refund_count += sign
+
+
+@dataclass
+class ContractTotals(Totals):
+    """Running totals for one contract, with its agreed amount"""
+    total_amount: Decimal = ZERO
+    deposit_amount: Decimal = ZERO
+    currency: str = None
+
+    @property
+    def outstanding(self):
+        return self.total_amount - self.paid
+
+    @property
+    def deposit_outstanding(self):
+        # Any payment (including 'full') covers the deposit first
+        return max(self.deposit_amount - self.paid, ZERO)
+
+    @property
+    def paid_percent(self):
+        if not self.total_amount:
+            return ZERO
+        return (self.paid * 100 / self.total_amount).quantize(ZERO)
+
+
+@dataclass
+class PaymentLedger:
+    """Materialized payment totals fed by an append-only event stream"""
+    contracts: dict = field(default_factory=dict)
+    agents: dict = field(default_factory=dict)
+    daily: dict = field(default_factory=dict)
+    rejected: list = field(default_factory=list)
+    _current: dict = field(default_factory=dict, repr=False)
+
+    def register_contract(self, contract_id, total_amount, currency, deposit_amount=None):
+        """Set (or update after an Anex) the agreed amount of a contract"""
+        totals = self.contracts.setdefault(contract_id, ContractTotals())
+        if totals.currency and totals.currency != currency and _has_payments(totals):
+            raise ValueError(
+                f"Contract {contract_id} already has payments in {totals.currency}, "
+                f"can not register it in {currency}"
+            )
+        totals.total_amount = Decimal(str(total_amount))
+        totals.deposit_amount = Decimal(str(deposit_amount)) if deposit_amount is not None else ZERO
+        totals.currency = currency
+        return totals
+
+    def apply(self, event):
+        """Apply one event; returns False for stale versions and rejected events"""
+        previous = self._current.get(event.payment_id)
+        if previous is not None and event.seq <= previous.seq:
+            return False
+
+        contract = self.contracts.get(event.contract_id)
+        if contract is not None and contract.currency and contract.currency != event.currency:
+            self.rejected.append(event)
+            return False
+
+        if previous is not None:
+            self._contribute(previous, -1)
+        self._contribute(event, 1)
+        self._current[event.payment_id] = event
+        return True
+
+    def apply_all(self, events):
+        """Apply events in stream order, returning how many were new"""
+        return sum(1 for event in events if self.apply(event))
+
+    def _contribute(self, event, sign):
+        contract = self.contracts.setdefault(event.contract_id, ContractTotals(currency=event.currency))
+        contract.apply(event, sign)
+
+        agent_key = (event.organization_id, event.recorded_by, event.currency)
+        self.agents.setdefault(agent_key, Totals()).apply(event, sign)
+
+        day_key = (event.organization_id, event.recorded_by, event.payment_date, event.currency)
+        self.daily.setdefault(day_key, Totals()).apply(event, sign)
+
+    # -----------------------------------------------------
+    # Reads
+    # -----------------------------------------------------
+
+    def contract_totals(self, contract_id):
+        """Totals for the contract payment specification table"""
+        return self.contracts.get(contract_id) or ContractTotals()
+
+    def agent_totals(self, organization_id, user_id, currency):
+        return self.agents.get((organization_id, user_id, currency)) or Totals()
+
+    def daily_totals(self, organization_id, user_id, day, currency):
+        """Totals for one daily_reconciliations row (revenue_total = paid)"""
+        return self.daily.get((organization_id, user_id, day, currency)) or Totals()
+
+    # -----------------------------------------------------
+    # Verification
+    # -----------------------------------------------------
+
+    @classmethod
+    def rebuild(cls, events, contract_amounts=()):
+        """Recompute all totals from scratch by replaying the full stream"""
+        ledger = cls()
+        for contract_id, total_amount, currency, deposit_amount in contract_amounts:
+            ledger.register_contract(contract_id, total_amount, currency, deposit_amount)
+        ledger.apply_all(sorted(events, key=lambda event: event.seq))
+        return ledger
+
+    def verify(self, events):
+        """Compare running totals with a full rebuild; returns mismatched keys"""
+        contract_amounts = [
+            (contract_id, totals.total_amount, totals.currency, totals.deposit_amount)
+            for contract_id, totals in self.contracts.items()
+        ]
+        rebuilt = self.rebuild(events, contract_amounts)
+
+        mismatches = []
+        for name in ('contracts', 'agents', 'daily'):
+            ours = _nonzero(getattr(self, name))
+            theirs = _nonzero(getattr(rebuilt, name))
+            for key in ours.keys() | theirs.keys():
+                if ours.get(key) != theirs.get(key):
+                    mismatches.append((name, key))
+
+        ours = {event.seq for event in self.rejected}
+        theirs = {event.seq for event in rebuilt.rejected}
+        mismatches.extend(('rejected', seq) for seq in sorted(ours ^ theirs))
+        return mismatches
+
+
+def _has_payments(totals):
+    return bool(totals.paid or totals.pending or totals.payment_count or totals.refund_count)
+
+
+def _nonzero(table):
+    """Drop keys whose totals were fully retracted"""
+    return {key: totals for key, totals in table.items() if totals != type(totals)()}
+
+
+def load_events(path):
+    """Read a JSON-lines export of contract_payments row versions"""
+    with open(path, encoding='utf-8') as f:
+        return [
+            PaymentEvent.from_row(seq, json.loads(line))
+            for seq, line in enumerate(f, start=1)
+            if line.strip()
+        ]
+
+
+if __name__ == '__main__':
+    events = load_events(sys.argv[1])
+    ledger = PaymentLedger.rebuild(events)
+    for (organization_id, user_id, day, currency), totals in sorted(ledger.daily.items(), key=str):
+        print(f"{day}  {user_id}  {totals.paid:>12} {currency}  ({totals.payment_count} uplata, {totals.refund_count} povrata)")
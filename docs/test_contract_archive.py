@@ -0,0 +1,119 @@
+"""
+Tests for contract_archive: exact PDF round trip, deduplication and search
+"""
+
+import os
+import tempfile
+import unittest
+
+from contract_archive import (
+    DIRECT_LENGTH, ArchiveError, ContractArchive, join_pdf, split_pdf,
+)
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Attachments', 'Ugovor my travel 6.26.pdf')
+
+
+def contract(contract_id, last_name='Hodžić', check_in='2026-07-15', check_out='2026-07-22', departure_id=None):
+    return {
+        'contract_id': contract_id,
+        'contract_number': f'{contract_id} / 2026',
+        'passengers': [{'first_name': 'Amra', 'last_name': last_name}],
+        'hotel_name': 'Pearl Beach',
+        'destination_country': 'Crna Gora',
+        'check_in_date': check_in,
+        'check_out_date': check_out,
+        'departure_id': departure_id,
+    }
+
+
+class SplitPdfTest(unittest.TestCase):
+
+    def test_indirect_length_is_not_read_as_direct(self):
+        self.assertIsNone(DIRECT_LENGTH.search(b'/Length 12 0 R'))
+        self.assertEqual(DIRECT_LENGTH.search(b'/Length 12 /Filter').group(1), b'12')
+
+    def test_length_before_nested_dictionary(self):
+        data = bytes(range(256)) * 8
+        pdf = (
+            b'%PDF-1.4\n1 0 obj\n<< /Length ' + str(len(data)).encode()
+            + b' /DecodeParms << /Columns 4 >> >>\nstream\n' + data + b'\nendstream\nendobj\n%%EOF\n'
+        )
+        skeleton, streams = split_pdf(pdf)
+
+        # The endstream fallback would include the trailing newline
+        self.assertEqual(streams[0][1], data)
+        self.assertEqual(join_pdf(skeleton, streams), pdf)
+
+
+class ContractArchiveTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(SAMPLE_PDF, 'rb') as f:
+            cls.sample = f.read()
+
+    def setUp(self):
+        self.archive = ContractArchive(':memory:')
+
+    def tearDown(self):
+        self.archive.close()
+
+    def test_round_trip_and_deduplication(self):
+        ugovor = self.archive.store(contract('c1'), self.sample)
+        after_first = self.archive.stats()
+        anex = self.archive.store(contract('c1'), self.sample, document_type='anex', amendment_number=1)
+        after_second = self.archive.stats()
+
+        self.assertEqual(self.archive.get_pdf(ugovor), self.sample)
+        self.assertEqual(self.archive.get_pdf(anex), self.sample)
+        self.assertEqual(self.archive.get_payload(anex), contract('c1'))
+        self.assertGreater(after_first['shared_resources'], 0)
+        self.assertEqual(after_second['shared_resources'], after_first['shared_resources'])
+        self.assertLess(after_second['stored_bytes'], after_second['original_bytes'])
+
+    def test_store_is_idempotent(self):
+        document_id = self.archive.store(contract('c1'), self.sample)
+
+        self.assertEqual(self.archive.store(contract('c1'), self.sample), document_id)
+        with self.assertRaises(ArchiveError):
+            self.archive.store(contract('c1'), self.sample + b'\n')
+
+    def test_store_from_second_connection(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'archive.db')
+            with ContractArchive(path) as first, ContractArchive(path) as second:
+                document_id = first.store(contract('c1'), self.sample)
+                self.assertEqual(second.store(contract('c1'), self.sample), document_id)
+                with self.assertRaises(ArchiveError):
+                    second.store(contract('c1'), self.sample + b'\n')
+
+    def test_search_folds_diacritics(self):
+        hodzic = self.archive.store(contract('c1'), self.sample)
+        dordevic = self.archive.store(contract('c2', last_name='Đorđević'), self.sample)
+
+        self.assertEqual([r['id'] for r in self.archive.search('hodzic')], [hodzic])
+        for query in ('Đorđević', 'dordevic', 'djordjevic', 'DJORDJ'):
+            self.assertEqual([r['id'] for r in self.archive.search(query)], [dordevic], query)
+        self.assertEqual(self.archive.search(''), [])
+
+    def test_find_for_passenger_matches_departure_exactly(self):
+        same_day = self.archive.store(contract('a', check_in='2026-07-15'), self.sample)
+        self.archive.store(contract('b', check_in='2026-06-15', check_out='2026-07-01'), self.sample)
+        self.archive.store(contract('c', check_in='2026-07-08', check_out='2026-07-15'), self.sample)
+        by_id = self.archive.store(contract('d', check_in='2026-08-01', departure_id='dep-42'), self.sample)
+        self.archive.store(contract('e', last_name='Kovač', check_in='2026-07-15'), self.sample)
+
+        def ids(passenger, departure):
+            return [r['id'] for r in self.archive.find_for_passenger(passenger, departure)]
+
+        self.assertEqual(ids('Hodzic', '2026-07-15'), [same_day])
+        self.assertEqual(ids('Hodzic', '2026-07-1'), [])
+        self.assertEqual(ids('hodžić', 'dep-42'), [by_id])
+        self.assertEqual(len(ids('Hodzic', '')), 4)
+        self.assertEqual(len(ids('', '2026-07-15')), 2)
+        self.assertEqual(ids('', '...'), [])
+        self.assertEqual(ids('...', ''), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Tests for payment_ledger: incremental totals must match a full rebuild
+"""
+
+from datetime import date
+from decimal import Decimal
+import unittest
+
+from payment_ledger import ZERO, PaymentEvent, PaymentLedger
+
+
+def event(seq, payment_id, payment_type, amount, status='completed', currency='EUR', day=1, contract_id='c1'):
+    return PaymentEvent(
+        seq, payment_id, contract_id, 'org', 'agent', date(2026, 1, day),
+        payment_type, Decimal(amount), currency, status,
+    )
+
+
+class PaymentLedgerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ledger = PaymentLedger()
+        self.ledger.register_contract('c1', '1450.00', 'EUR', '435.00')
+        self.totals = self.ledger.contract_totals('c1')
+
+    def test_correction_retracts_previous_version(self):
+        events = [
+            event(1, 'p1', 'deposit', '400.00'),
+            event(2, 'p1', 'deposit', '435.00'),
+        ]
+        self.ledger.apply_all(events)
+
+        self.assertEqual(self.totals.paid, Decimal('435.00'))
+        self.assertEqual(self.totals.payment_count, 1)
+        self.assertEqual(self.ledger.verify(events), [])
+
+    def test_status_transitions(self):
+        events = [
+            event(1, 'p1', 'balance', '1015.00', status='pending'),
+            event(2, 'p1', 'balance', '1015.00'),
+            event(3, 'p2', 'balance', '50.00', status='pending'),
+            event(4, 'p2', 'balance', '50.00', status='failed'),
+        ]
+        self.ledger.apply_all(events)
+
+        self.assertEqual(self.totals.paid, Decimal('1015.00'))
+        self.assertEqual(self.totals.pending, ZERO)
+        self.assertEqual(self.totals.outstanding, Decimal('435.00'))
+        self.assertEqual(self.ledger.verify(events), [])
+
+    def test_refund_is_subtracted_once(self):
+        events = [
+            event(1, 'p1', 'balance', '1000.00'),
+            event(2, 'p1', 'balance', '1000.00', status='refunded'),
+            event(3, 'r1', 'refund', '-1000.00', day=2),
+        ]
+        self.ledger.apply_all(events)
+
+        self.assertEqual(self.totals.paid, ZERO)
+        self.assertEqual(self.totals.refunded, Decimal('1000.00'))
+        self.assertEqual((self.totals.payment_count, self.totals.refund_count), (1, 1))
+        self.assertEqual(self.ledger.verify(events), [])
+
+    def test_stale_and_late_events(self):
+        events = [
+            event(1, 'p1', 'deposit', '400.00'),
+            event(3, 'p1', 'deposit', '435.00'),
+            event(2, 'p2', 'balance', '100.00'),
+        ]
+        self.assertEqual(self.ledger.apply_all(events), 3)
+        self.assertFalse(self.ledger.apply(events[0]))
+
+        self.assertEqual(self.totals.paid, Decimal('535.00'))
+        self.assertEqual(self.ledger.verify(events), [])
+
+    def test_full_payment_covers_deposit(self):
+        self.ledger.apply(event(1, 'p1', 'full', '1450.00'))
+
+        self.assertEqual(self.totals.outstanding, ZERO)
+        self.assertEqual(self.totals.deposit_outstanding, ZERO)
+
+    def test_daily_totals(self):
+        events = [
+            event(1, 'p1', 'deposit', '435.00', day=1),
+            event(2, 'p2', 'balance', '1015.00', day=2),
+        ]
+        self.ledger.apply_all(events)
+
+        self.assertEqual(self.ledger.daily_totals('org', 'agent', date(2026, 1, 2), 'EUR').paid, Decimal('1015.00'))
+        self.assertEqual(self.ledger.agent_totals('org', 'agent', 'EUR').paid, Decimal('1450.00'))
+
+    def test_currency_mismatch_is_rejected_without_stopping_the_stream(self):
+        events = [
+            event(1, 'p1', 'deposit', '435.00'),
+            event(2, 'p2', 'balance', '500.00', currency='BAM'),
+            event(3, 'p3', 'balance', '1015.00'),
+        ]
+        self.assertEqual(self.ledger.apply_all(events), 2)
+
+        self.assertEqual(self.totals.paid, Decimal('1450.00'))
+        self.assertEqual([e.seq for e in self.ledger.rejected], [2])
+        self.assertEqual(self.ledger.verify(events), [])
+
+    def test_currency_change_with_payments_is_refused(self):
+        self.ledger.apply(event(1, 'p1', 'deposit', '435.00'))
+
+        with self.assertRaises(ValueError):
+            self.ledger.register_contract('c1', '1450.00', 'BAM', '435.00')
+        self.ledger.register_contract('c1', '1500.00', 'EUR', '435.00')
+        self.assertEqual(self.totals.outstanding, Decimal('1065.00'))
+
+
+if __name__ == '__main__':
+    unittest.main()